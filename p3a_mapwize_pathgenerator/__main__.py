@@ -0,0 +1,3 @@
+from p3a_mapwize_pathgenerator.cli import main
+
+main()
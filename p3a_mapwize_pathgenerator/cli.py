@@ -0,0 +1,147 @@
+import argparse
+
+from p3a_mapwize_pathgenerator.mapwize import Collector
+from p3a_mapwize_pathgenerator.scheduler import Scheduler
+from p3a_mapwize_pathgenerator.stats import Stats
+
+
+def _add_generate_parser(subparsers):
+    parser = subparsers.add_parser("generate", help="Generate an experiment (see Collector.generate_experiment)")
+    parser.add_argument("--sampling-ratio", type=float, default=0.05,
+                        help="Percentage (between 0 and 1) of traces to use")
+    parser.add_argument("--linear-sampling", action="store_true",
+                        help="Use sampling_ratio for a linear sampling instead of a discrete sampling step")
+    parser.add_argument("--alpha-noise", type=float, default=0.25,
+                        help="The position noise range for each step in m")
+    parser.add_argument("--alpha-speed", type=float, default=0.1, help="The speed noise range for each step in m/s")
+    parser.add_argument("--min-speed", type=float, default=0.3, help="The minimum allowed speed in m/s")
+    parser.add_argument("--max-speed", type=float, default=2, help="The maximum allowed speed in m/s")
+    parser.add_argument("--extend-up-to", type=int, default=-1,
+                        help="The number of steps up to which we should combine paths (-1 to do nothing)")
+    parser.add_argument("--groundtruth", action="store_true", help="Also write the noiseless positions")
+    parser.add_argument("--seed", type=int, help="The experiment seed (random if not provided)")
+    parser.add_argument("--manifest-only", action="store_true",
+                        help="Only write the manifest, traces can be regenerated from it")
+    parser.add_argument("--period", type=float, default=1, help="The simulation sampling period in seconds")
+    parser.add_argument("--output-periods", type=float, nargs="+",
+                        help="Other sampling periods in seconds to resample the simulated traces to")
+    parser.add_argument("--experiment", help="The experiment name (defaults to the current date and time)")
+    parser.add_argument("--resume", metavar="EXPERIMENT",
+                        help="Complete an interrupted experiment (all the other options but the shard are ignored)")
+    _add_shard_arguments(parser)
+    parser.set_defaults(func=_generate)
+
+
+def _add_shard_arguments(parser):
+    parser.add_argument("--shard-index", type=int, default=0, help="The shard to process (between 0 and count - 1)")
+    parser.add_argument("--shard-count", type=int, default=1, help="The number of shards of the experiment")
+
+
+def _generate(args):
+    experiment = Collector.generate_experiment(
+        sampling_ratio=args.sampling_ratio,
+        linear_sampling=args.linear_sampling,
+        alpha_noise=args.alpha_noise,
+        alpha_speed=args.alpha_speed,
+        min_speed=args.min_speed,
+        max_speed=args.max_speed,
+        extend_up_to=args.extend_up_to,
+        groundtruth=args.groundtruth,
+        seed=args.seed,
+        write_traces=not args.manifest_only,
+        experiment=args.experiment,
+        resume=args.resume,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count,
+        period=args.period,
+        output_periods=args.output_periods
+    )
+    print(experiment)
+
+
+def _add_day_parser(subparsers):
+    parser = subparsers.add_parser("day", help="Simulate a day of visits in the venue (see Scheduler.generate_day)")
+    parser.add_argument("--duration", type=float, default=8 * 3600,
+                        help="Duration of the day in seconds (no arrival after it)")
+    parser.add_argument("--arrival-rate", type=float, nargs="+", default=[0.1],
+                        help="Users arriving per second, several values for equal slots of the day (e.g. hourly)")
+    parser.add_argument("--mean-dwell", type=float, default=300, help="Mean dwell time at a place in seconds")
+    parser.add_argument("--leave-probability", type=float, default=0.3,
+                        help="Probability to leave the venue after each walk")
+    parser.add_argument("--alpha-noise", type=float, default=0.25,
+                        help="The position noise range for each step in m")
+    parser.add_argument("--alpha-speed", type=float, default=0.1, help="The speed noise range for each step in m/s")
+    parser.add_argument("--min-speed", type=float, default=0.3, help="The minimum allowed speed in m/s")
+    parser.add_argument("--max-speed", type=float, default=2, help="The maximum allowed speed in m/s")
+    parser.add_argument("--seed", type=int, help="The experiment seed (random if not provided)")
+    parser.add_argument("--experiment", help="The experiment name (defaults to the current date and time)")
+    parser.set_defaults(func=_day)
+
+
+def _day(args):
+    experiment, stats = Scheduler.generate_day(
+        duration=args.duration,
+        arrival_rate=args.arrival_rate[0] if len(args.arrival_rate) == 1 else args.arrival_rate,
+        mean_dwell=args.mean_dwell,
+        leave_probability=args.leave_probability,
+        alpha_noise=args.alpha_noise,
+        alpha_speed=args.alpha_speed,
+        min_speed=args.min_speed,
+        max_speed=args.max_speed,
+        seed=args.seed,
+        experiment=args.experiment
+    )
+    print(experiment, stats)
+
+
+def _add_stats_parser(subparsers):
+    parser = subparsers.add_parser("stats", help="Compute the statistics of an experiment (see Stats)")
+    parser.add_argument("experiment", help="The experiment name")
+    parser.add_argument("--processes", type=int, help="The number of worker processes (defaults to the cpus count)")
+    _add_shard_arguments(parser)
+    parser.set_defaults(func=_stats)
+
+
+def _stats(args):
+    stats = Stats.compute_experiment_stats(args.experiment, processes=args.processes,
+                                           shard_index=args.shard_index, shard_count=args.shard_count)
+    suffix = Collector.get_shard_suffix(args.shard_index, args.shard_count)
+    print(f"{stats['global']['traces']} traces, mean speed {stats['global']['speed']['mean']:.2f} m/s, "
+          f"written to {Collector.get_stats_file(args.experiment + suffix)}")
+
+
+def _add_merge_parser(subparsers):
+    parser = subparsers.add_parser("merge", help="Check and merge the shards of an experiment")
+    parser.add_argument("experiment", help="The experiment name")
+    parser.add_argument("--shard-count", type=int, required=True, help="The number of shards of the experiment")
+    parser.add_argument("--stats", action="store_true", help="Also merge the statistics computed by each shard")
+    parser.set_defaults(func=_merge)
+
+
+def _merge(args):
+    manifest = Collector.merge_shards(args.experiment, args.shard_count)
+    print(f"{len(manifest['traces'])} traces in {args.experiment}")
+    if args.stats:
+        Stats.merge_shards(args.experiment, args.shard_count)
+        print(f"Statistics written to {Collector.get_stats_file(args.experiment)}")
+
+
+def main(argv=None):
+    """
+    Entry point of the trajectory-generator command. Only the generation modules are imported (no plotting).
+
+    :param argv: The command line arguments (defaults to sys.argv[1:])
+    """
+    parser = argparse.ArgumentParser(prog="trajectory-generator", description="Random indoor trajectories generator")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    _add_generate_parser(subparsers)
+    _add_day_parser(subparsers)
+    _add_stats_parser(subparsers)
+    _add_merge_parser(subparsers)
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,8 @@
-import json
 import matplotlib.pyplot as plt
 import numpy as np
 
 from p3a_mapwize_pathgenerator.helper import GeolifeFormatHelper
-from p3a_mapwize_pathgenerator.config import DATA_PATH
-
-
-def collect_local_data():
-    with open(f'{DATA_PATH}places.json', 'r') as places:
-        places = json.load(places)
-    with open(f'{DATA_PATH}path.json', 'r') as path:
-        path = json.load(path)
-    with open(f'{DATA_PATH}paths_4_floor.json', 'r') as paths4:
-        paths4 = json.load(paths4)
-    with open(f'{DATA_PATH}paths_4_floor_full.json', 'r') as paths4_full:
-        paths4_full = json.load(paths4_full)
-    print("Data loaded...")
-    return places, path, paths4, paths4_full
+from p3a_mapwize_pathgenerator.venue import collect_local_data  # noqa: F401 (kept importable from display)
 
 
 # Collect all floors
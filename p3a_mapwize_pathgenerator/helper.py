@@ -1,18 +1,20 @@
 import numpy as np
 from numpy import random
+import json
+import os
 from datetime import datetime, timedelta
-from geopy import distance as geopydist
 from math import pi, cos, sqrt
 
 
 class Helper:
     @staticmethod
-    def unif(a, b):
+    def unif(a, b, rng=random):
         """
+        :param rng: The random generator to draw from (defaults to the global numpy one)
         :return: A random value uniformly in [a, b]
         :rtype: float
         """
-        return a + (b - a) * random.rand()
+        return a + (b - a) * rng.rand()
 
     @staticmethod
     def borne(value, _min, _max):
@@ -30,7 +32,18 @@ class Helper:
             return value
 
     @staticmethod
-    def to_plt(pos, period, filename):
+    def sync(file):
+        """
+        Flushes a file to the disk. Files are synced before being renamed, otherwise after a power loss the renamed
+        file could be empty while the logs written after it say it is complete.
+
+        :param file: The opened file
+        """
+        file.flush()
+        os.fsync(file.fileno())
+
+    @staticmethod
+    def to_plt(pos, period, filename, dt=None, rng=random):
         """
         Format a list of positions to the .plt format. Here is the description from the Microsoft GeoLife project.
 
@@ -47,15 +60,21 @@ class Helper:
         :param pos: List of positions (lat, lon) to write as .plt file
         :param float period: The sampling period in seconds
         :param str filename: Path to the file
-        :return:
+        :param int dt: Start time in seconds since 12/30/1899 (random if not provided)
+        :param rng: The random generator to draw the start time from (defaults to the global numpy one)
+        The file is written atomically: it is either complete or absent, even if the process is killed.
+        :return: The start time used, to write related traces (e.g. the ground truth) with the same timestamps
+        :rtype: int
         """
         START_DATE = datetime(1899, 12, 30)
         DAY_IN_SECONDS = 24 * 60 * 60.
         LINE_END = "\n"
         # to all start at a different moment
         # -> have a different seed in builder.build_path() even if same lat/lon
-        dt = random.randint(0, 1000000)
-        with open(filename, "w+") as file:
+        if dt is None:
+            dt = rng.randint(0, 1000000)
+        start_dt = dt
+        with open(filename + ".tmp", "w+") as file:
             for i in range(1, 7):
                 file.write(f"Offset line {i}{LINE_END}")
             for lat, lon in pos:
@@ -66,6 +85,45 @@ class Helper:
                 data_str = ",".join(list(map(str, data))) + LINE_END
                 file.write(data_str)
                 dt += period
+            Helper.sync(file)
+        os.replace(filename + ".tmp", filename)
+        return start_dt
+
+    @staticmethod
+    def resample(pos, period, output_period):
+        """
+        Resamples positions to another sampling period, starting from the first position.
+        If output_period is a multiple of period, the positions are simply decimated. Otherwise they are linearly
+        interpolated between the 2 closest positions.
+
+        :param pos: List of positions (lat, lon) sampled every period
+        :param float period: The sampling period of pos in seconds
+        :param float output_period: The sampling period to resample to in seconds
+        :return: The positions (lat, lon) sampled every output_period
+        :rtype: numpy ndarray
+        """
+        pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+        ratio = output_period / period
+        if abs(ratio - round(ratio)) < 1e-9:
+            return pos[::int(round(ratio))]
+        if len(pos) == 0:
+            return pos[:0]  # nothing to interpolate from
+        times = np.arange(len(pos)) * period
+        output_times = np.arange(0, times[-1] + 1e-9, output_period)
+        return np.column_stack((np.interp(output_times, times, pos[:, 0]), np.interp(output_times, times, pos[:, 1])))
+
+    @staticmethod
+    def to_json(data, filename):
+        """
+        Atomically writes data as a json file: the file is either complete or absent, even if the process is killed.
+
+        :param data: The json serializable data to write
+        :param str filename: Path to the file
+        """
+        with open(filename + ".tmp", "w+") as file:
+            json.dump(data, file)
+            Helper.sync(file)
+        os.replace(filename + ".tmp", filename)
 
 
 class GeolifeFormatHelper:
@@ -109,6 +167,7 @@ class GeolifeFormatHelper:
         :return: The coordinates (x, y) in meters.
         :rtype: (float, float)
         """
+        from geopy import distance as geopydist  # only needed for display, keep it out of the generation imports
         y = geopydist.distance((lat, ref[1]), ref).m  # same lon => D_lat
         if lat < ref[0]:
             y = -y
@@ -151,6 +210,25 @@ class GeolifeFormatHelper:
         d = sqrt(x * x + y * y) * 6.3781e6
         return d
 
+    @staticmethod
+    def get_dist_lines(coords1, coords2):
+        """
+        Vectorized version of :func:`get_dist_line` working on arrays of points (same approximation and error).
+
+        :param coords1: Source coordinates as rows (lat, lon).
+        :type coords1: numpy ndarray of shape (n, 2)
+        :param coords2: Destination coordinates as rows (lat, lon).
+        :type coords2: numpy ndarray of shape (n, 2)
+        :return: The approximate distances between each pair of rows in meters.
+        :rtype: numpy ndarray of shape (n,)
+        """
+        coords1 = np.asarray(coords1, dtype=float)
+        coords2 = np.asarray(coords2, dtype=float)
+        middle_lat = np.radians(coords1[..., 0] + coords2[..., 0]) / 2  # We center the projection
+        x = np.radians(coords2[..., 1] - coords1[..., 1]) * np.cos(middle_lat)
+        y = np.radians(coords2[..., 0] - coords1[..., 0])
+        return np.sqrt(x * x + y * y) * 6.3781e6
+
     @staticmethod
     def convert_speed_to_degrees(start, end, speed_in_ms):
         """
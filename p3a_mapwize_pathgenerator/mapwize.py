@@ -1,15 +1,22 @@
 from numpy.linalg import norm
-from numpy import array, random, genfromtxt, cos
+from numpy import array, random, genfromtxt, cos, sqrt, uint64
 from datetime import datetime
+import json
 import os
 import shutil
 
 from p3a_mapwize_pathgenerator.helper import Helper, GeolifeFormatHelper
-from p3a_mapwize_pathgenerator.display import collect_local_data
+from p3a_mapwize_pathgenerator.venue import get_venue
 from p3a_mapwize_pathgenerator.config import TRACES_PATH
 
 
 class Collector:
+    MANIFEST = "manifest.json"
+    # Indexes of the traces already written, one per line, to resume interrupted experiments
+    COMPLETED = "completed.log"
+    # Philox stream used to select the traces of an experiment, the other streams are the trace indexes
+    SELECTION_STREAM = 2 ** 64 - 1
+
     @staticmethod
     def max_speed(max_speed, alpha_noise, period):
         """
@@ -26,7 +33,7 @@ class Collector:
     @staticmethod
     def follow_direction(start, end, initial_noise, initial_speed,
                          alpha_noise=0.25, alpha_speed=0.1, min_speed=0.3, max_speed=2,
-                         delta_dt=0, period=1):
+                         delta_dt=0, period=1, groundtruth=False, rng=random):
         """
         Generates the list of positions between 2 points: start and end.
         Also returns the useful information to keep following directions.
@@ -44,7 +51,10 @@ class Collector:
         :type start: numpy ndarray
         :param float delta_dt: the remaining movement time to do based on speed, period and past movement in second
         :param float period: The sampling period in seconds
+        :param boolean groundtruth: Should the noiseless positions also be returned (as a 5th element)
+        :param rng: The random generator to draw the noise from (defaults to the global numpy one)
         :return: The list of positions, the 2D noise, the current speed, the remaining time
+            (and the list of noiseless positions if groundtruth)
         :rtype: :obj:`tuple` of (numpy 2d-array of :obj:`float`, np array of :obj:`float`, :obj:`float`, :obj:`float`)
         """
         # The meter -> degree conversion is constant on the latitude axis but the longitude axis got squeezed as we
@@ -73,18 +83,23 @@ class Collector:
         )
         lambda_dir = (speed_in_degrees * delta_dt) / total_degrees_dist
         pos = []
+        clean_pos = []
 
         while lambda_dir <= 1:
-            next_pos = start + lambda_dir * direction + noise
+            clean_next_pos = start + lambda_dir * direction
+            next_pos = clean_next_pos + noise
             Collector.check_speed(pos, start + noise, next_pos, period,
                                   Collector.max_speed(max_speed, alpha_noise, period))
             pos.append(next_pos)
+            if groundtruth:
+                clean_pos.append(clean_next_pos)
             # Case 1: there is still some move on this direction to do compute all the deltas
-            d_lat = Helper.unif(-1, 1)  # When using unif(-1, 1), we usually see a dispersion to up to 3 times the noise
+            # When using unif(-1, 1), we usually see a dispersion to up to 3 times the noise
+            d_lat = Helper.unif(-1, 1, rng)
             # To remain below the speed limit, we need to subtract d_lat ** 2
             # Besides, 1 lon meter is worth more degrees as we go towards the poles
-            d_lon = Helper.unif(-1 + d_lat ** 2, 1 - d_lat ** 2) / cos(start[1])
-            d_speed = Helper.unif(-1, 1)
+            d_lon = Helper.unif(-1 + d_lat ** 2, 1 - d_lat ** 2, rng) / cos(start[1])
+            d_speed = Helper.unif(-1, 1, rng)
 
             # iterate noise and speed_in_degrees
             noise += alpha_noise_in_degrees * array([d_lat, d_lon])
@@ -103,8 +118,35 @@ class Collector:
 
         # 2. Pass the remaining movement to the next call
         # return with the positions and the useful information to continue following directions
-        return array(pos), noise, GeolifeFormatHelper.convert_speed_from_degrees(start, end,
-                                                                                 speed_in_degrees), remaining_dt
+        speed = GeolifeFormatHelper.convert_speed_from_degrees(start, end, speed_in_degrees)
+        if groundtruth:
+            return array(pos), noise, speed, remaining_dt, array(clean_pos)
+        return array(pos), noise, speed, remaining_dt
+
+    @staticmethod
+    def stay(position, initial_noise, n_steps, alpha_noise=0.25, rng=random):
+        """
+        Generates the positions sampled while standing still: the noise keeps moving with the same steps as in
+        :func:`follow_direction`.
+
+        :param position: The coordinates (lat, lon) of the place
+        :type position: numpy ndarray
+        :param initial_noise: (lon, lat) initial noise
+        :param int n_steps: The number of positions to sample
+        :param float alpha_noise: The position noise range for each step in m (used for both lon and lat)
+        :param rng: The random generator to draw the noise from (defaults to the global numpy one)
+        :return: The list of positions and the 2D noise
+        :rtype: (numpy 2d-array of :obj:`float`, np array of :obj:`float`)
+        """
+        alpha_noise_in_degrees = alpha_noise * GeolifeFormatHelper.EQUATOR_METERS_TO_DEGREES
+        noise = initial_noise.astype(float)
+        pos = []
+        for _ in range(n_steps):
+            pos.append(position + noise)
+            d_lat = Helper.unif(-1, 1, rng)
+            d_lon = Helper.unif(-1 + d_lat ** 2, 1 - d_lat ** 2, rng) / cos(position[1])
+            noise += alpha_noise_in_degrees * array([d_lat, d_lon])
+        return array(pos), noise
 
     @staticmethod
     def check_speed(pos, start, next_pos, period, max_speed):
@@ -122,7 +164,8 @@ class Collector:
 
     @staticmethod
     def follow_path(path, noise=array([0, 0]), speed=1.3, delta_dt=0,
-                    alpha_noise=0.25, alpha_speed=0.1, min_speed=0.3, max_speed=2, period=1):
+                    alpha_noise=0.25, alpha_speed=0.1, min_speed=0.3, max_speed=2, period=1, groundtruth=False,
+                    rng=random):
         """
         Iterates on the directions of a path.
 
@@ -136,13 +179,17 @@ class Collector:
         :param float alpha_speed: The speed noise range for each step in m/s
         :param float alpha_noise: The position noise range for each step in m (used for both lon and lat)
         :param float period: The sampling period in seconds
+        :param boolean groundtruth: Should the noiseless positions also be returned (as a 5th element)
+        :param rng: The random generator to draw the noise from (defaults to the global numpy one)
         :return: The complete list of positions (lat, lon) from path[0] to path[-1]
+            (and the matching noiseless positions if groundtruth)
         :rtype: :obj:`list` of :obj:`list` of :obj:`float`
         """
         pos = []
+        clean_pos = []
         for i in range(len(path) - 1):
             start, end = array(path[i]), array(path[i + 1])
-            new_pos, noise, speed, delta_dt = Collector.follow_direction(
+            result = Collector.follow_direction(
                 start,
                 end,
                 noise,
@@ -152,20 +199,294 @@ class Collector:
                 min_speed=min_speed,
                 max_speed=max_speed,
                 delta_dt=delta_dt,
-                period=period
+                period=period,
+                groundtruth=groundtruth,
+                rng=rng
             )
+            new_pos, noise, speed, delta_dt = result[:4]
             pos.extend(new_pos)
+            if groundtruth:
+                clean_pos.extend(result[4])
+        if groundtruth:
+            return pos, noise, speed, delta_dt, clean_pos
         return pos, noise, speed, delta_dt
 
     @staticmethod
     def get_stats_file(experiment):
         return f"{experiment}_stats.txt"
 
+    @staticmethod
+    def get_step_noise(alpha, period):
+        """
+        Scales a noise range given for 1 second steps to steps of the given period. Noise and speed follow random
+        walks: the variance of the sum of n steps is n times the one of a step, so the range scales with sqrt(period)
+        for the walks to keep the same variance over time whatever the sampling period.
+
+        :param float alpha: The noise range for 1 second steps
+        :param float period: The sampling period in seconds
+        :return: The noise range for each step
+        :rtype: float
+        """
+        return alpha * sqrt(period)
+
+    @staticmethod
+    def get_output_folder(folder, output_period=None):
+        """
+        :param str folder: Trajectory or Groundtruth
+        :param float output_period: The resampling period (None for the simulation period)
+        :return: The folder of the experiment where the traces at this period are written
+        :rtype: str
+        """
+        return folder if output_period is None else f"{folder}_{output_period:g}s"
+
+    @staticmethod
+    def get_rng(seed, stream):
+        """
+        Counter-based random generator (Philox) keyed by (seed, stream): its draws only depend on the key so any trace
+        can be regenerated in isolation, in any order and in parallel.
+
+        :param int seed: The experiment seed
+        :param int stream: The stream number (trace index or :attr:`SELECTION_STREAM`)
+        :return: A generator with the same API as the global numpy.random one
+        :rtype: numpy.random.RandomState
+        """
+        return random.RandomState(random.Philox(key=array([seed, stream], dtype=uint64)))
+
+    @staticmethod
+    def select_traces(params, venue, seed):
+        """
+        Lists the traces of an experiment. This only depends on the experiment seed and parameters.
+
+        :param venue: The venue routes (see :func:`get_venue <p3a_mapwize_pathgenerator.venue.get_venue>`)
+
+        :return: The traces descriptions: their name and either the index of their path in paths4 ('path')
+            or their starting place id ('start') when paths are extended
+        :rtype: :obj:`list` of :obj:`dict`
+        """
+        rng = Collector.get_rng(seed, Collector.SELECTION_STREAM)
+        sampling_ratio = params['sampling_ratio']
+        if params['linear_sampling']:
+            selected_paths4 = rng.choice(venue.n_paths, int(sampling_ratio * venue.n_paths), replace=False)
+        else:
+            sampling = int(venue.n_paths / (sampling_ratio * venue.n_paths))
+            selected_paths4 = range(0, venue.n_paths, sampling)
+
+        if params['extend_up_to'] == -1:
+            # one trace per sampled path
+            return [
+                {
+                    'name': "{}-{}".format(*venue.path(i)[1:]),
+                    'path': int(i)
+                }
+                for i in selected_paths4
+            ]
+        # one user per sampled path, we get a number of expected places to start from (with replacement)
+        place_ids = rng.choice(venue.full_sources(), len(selected_paths4), replace=True)
+        return [{'name': str(user_cpt), 'start': str(place_id)} for user_cpt, place_id in enumerate(place_ids)]
+
+    @staticmethod
+    def generate_trace(trace, params, venue, rng):
+        """
+        Generates the positions of a trace described by :func:`select_traces`.
+
+        :param dict trace: The trace description
+        :param dict params: The experiment parameters
+        :param venue: The venue routes (see :func:`get_venue <p3a_mapwize_pathgenerator.venue.get_venue>`)
+        :param rng: The random generator of the trace (see :func:`get_rng`)
+        :return: The positions and the noiseless positions (None if params['groundtruth'] is False)
+        :rtype: (:obj:`list`, :obj:`list`)
+        """
+        groundtruth = params['groundtruth']
+        follow_args = dict(
+            alpha_noise=Collector.get_step_noise(params['alpha_noise'], params['period']),
+            alpha_speed=Collector.get_step_noise(params['alpha_speed'], params['period']),
+            min_speed=params['min_speed'],
+            max_speed=params['max_speed'],
+            period=params['period'],
+            groundtruth=groundtruth,
+            rng=rng
+        )
+        if 'path' in trace:
+            # Convert to trace
+            result = Collector.follow_path(venue.path(trace['path'])[0], **follow_args)
+            return result[0], result[4] if groundtruth else None
+
+        # Loop through paths until we exceed the expected duration
+        extend_up_to = params['extend_up_to']
+        pos = []
+        clean_pos = []
+        current_place_id = trace['start']
+        # Initiate movement tracking variables
+        noise = array([0, 0])
+        speed = 1.3
+        delta_dt = 0
+        while len(pos) < extend_up_to:
+            # Pick a destination at random
+            next_place_id = rng.choice(venue.full_destinations(current_place_id))
+            # Convert to trace
+            result = Collector.follow_path(
+                venue.full_path(current_place_id, next_place_id),
+                noise=noise,
+                speed=speed,
+                delta_dt=delta_dt,
+                **follow_args
+            )
+            new_pos, noise, speed, delta_dt = result[:4]
+            if len(pos) > 0 and len(pos) + len(new_pos) > extend_up_to:
+                # if not empty and we exceed the duration -> stop
+                break
+            # else
+            pos.extend(new_pos)  # [:1] would cumulate the pos noises, thanks to them it's fine without it
+            # (but might be below min_speed)
+            if groundtruth:
+                clean_pos.extend(result[4])
+            current_place_id = next_place_id
+        return pos, clean_pos if groundtruth else None
+
+    @staticmethod
+    def get_manifest_file(experiment, shard_index=0, shard_count=1):
+        name, extension = os.path.splitext(Collector.MANIFEST)
+        return TRACES_PATH + f"{experiment}/{name}{Collector.get_shard_suffix(shard_index, shard_count)}{extension}"
+
+    @staticmethod
+    def read_manifest(experiment, shard_index=0, shard_count=1):
+        """
+        :param str experiment: The experiment name
+        :param int shard_index: The shard (see :func:`generate_experiment`)
+        :param int shard_count: The number of shards of the experiment
+        :return: The experiment manifest: its seed, parameters and traces descriptions
+        :rtype: dict
+        """
+        with open(Collector.get_manifest_file(experiment, shard_index, shard_count), 'r') as manifest:
+            return json.load(manifest)
+
+    @staticmethod
+    def get_shard_suffix(shard_index, shard_count):
+        """
+        :return: The suffix of the files specific to a shard (empty when the experiment is not sharded)
+        :rtype: str
+        """
+        return "" if shard_count == 1 else f"_{shard_index}-of-{shard_count}"
+
+    @staticmethod
+    def get_shard_traces(manifest, shard_index, shard_count):
+        """
+        :return: The indexes of the traces of the manifest generated by a shard
+        :rtype: range
+        """
+        return range(shard_index, len(manifest['traces']), shard_count)
+
+    @staticmethod
+    def get_completed_file(experiment, shard_index=0, shard_count=1):
+        name, extension = os.path.splitext(Collector.COMPLETED)
+        return TRACES_PATH + f"{experiment}/{name}{Collector.get_shard_suffix(shard_index, shard_count)}{extension}"
+
+    @staticmethod
+    def read_completed(experiment, shard_index=0, shard_count=1):
+        """
+        :param str experiment: The experiment name
+        :param int shard_index: The shard (see :func:`generate_experiment`)
+        :param int shard_count: The number of shards of the experiment
+        :return: The indexes of the traces already written
+        :rtype: :obj:`set` of :obj:`int`
+        """
+        completed_file = Collector.get_completed_file(experiment, shard_index, shard_count)
+        if not os.path.exists(completed_file):
+            return set()
+        with open(completed_file, 'r') as completed:
+            # a line without its end was being written when the process died: its trace will be written again
+            return {int(line) for line in completed if line.endswith("\n")}
+
+    @staticmethod
+    def truncate_completed(experiment, shard_index=0, shard_count=1):
+        """
+        Removes the line without its end left by a process killed while logging a trace (ignored by
+        :func:`read_completed`), so that the next logged index does not get appended to it.
+
+        :param str experiment: The experiment name
+        :param int shard_index: The shard (see :func:`generate_experiment`)
+        :param int shard_count: The number of shards of the experiment
+        """
+        completed_file = Collector.get_completed_file(experiment, shard_index, shard_count)
+        if not os.path.exists(completed_file):
+            return
+        with open(completed_file, 'rb+') as completed:
+            content = completed.read()
+            if content and not content.endswith(b"\n"):
+                completed.truncate(content.rfind(b"\n") + 1)
+
+    @staticmethod
+    def regenerate_trace(experiment, trace_index, data=None):
+        """
+        Regenerates a single trace of an experiment from its manifest (without replaying the other traces).
+
+        :param str experiment: The experiment name
+        :param int trace_index: The index of the trace in the manifest
+        :param data: Optional (paths4, paths4_full) or venue to avoid reloading them for each trace (see
+            :func:`get_venue <p3a_mapwize_pathgenerator.venue.get_venue>`), e.g. a
+            :class:`SharedVenue <p3a_mapwize_pathgenerator.venue.SharedVenue>` attached by a worker
+        :return: The positions and the noiseless positions (None if the experiment has no ground truth)
+        :rtype: (:obj:`list`, :obj:`list`)
+        """
+        manifest = Collector.read_manifest(experiment)
+        return Collector.generate_trace(
+            manifest['traces'][trace_index],
+            manifest['params'],
+            get_venue(data),
+            Collector.get_rng(manifest['seed'], trace_index)
+        )
+
+    @staticmethod
+    def write_trace(experiment, trace_index, manifest, venue):
+        """
+        Generates a trace of the manifest and writes it (and its ground truth if needed) as .plt files.
+
+        :param str experiment: The experiment name
+        :param int trace_index: The index of the trace in the manifest
+        :param dict manifest: The experiment manifest (see :func:`read_manifest`)
+        :param venue: The venue routes (see :func:`get_venue <p3a_mapwize_pathgenerator.venue.get_venue>`)
+        """
+        params = manifest['params']
+        trace = manifest['traces'][trace_index]
+        rng = Collector.get_rng(manifest['seed'], trace_index)
+        pos, clean_pos = Collector.generate_trace(trace, params, venue, rng)
+        # Write as file
+        filename = f"{trace['name']}.plt"
+        period = params['period']
+        dt = Helper.to_plt(pos, period, TRACES_PATH + f"{experiment}/Trajectory/{filename}", rng=rng)
+        if params['groundtruth']:
+            Helper.to_plt(clean_pos, period, TRACES_PATH + f"{experiment}/Groundtruth/{filename}", dt)
+        # Same simulation seen by sensors with other sampling rates
+        # manifests written before output periods were supported don't have them
+        for output_period in params.get('output_periods', []):
+            folder = Collector.get_output_folder("Trajectory", output_period)
+            Helper.to_plt(Helper.resample(pos, period, output_period), output_period,
+                          TRACES_PATH + f"{experiment}/{folder}/{filename}", dt)
+            if params['groundtruth']:
+                folder = Collector.get_output_folder("Groundtruth", output_period)
+                Helper.to_plt(Helper.resample(clean_pos, period, output_period), output_period,
+                              TRACES_PATH + f"{experiment}/{folder}/{filename}", dt)
+
     @staticmethod
     def generate_experiment(sampling_ratio=0.05, linear_sampling=False, alpha_noise=0.25, alpha_speed=0.1,
-                            min_speed=0.3, max_speed=2, extend_up_to=-1):
+                            min_speed=0.3, max_speed=2, extend_up_to=-1, groundtruth=False, seed=None,
+                            write_traces=True, experiment=None, resume=None, shard_index=0, shard_count=1,
+                            period=1, output_periods=None, venue=None):
         """
         ATTENTION: the maximum real speed is (max_speed * period + alpha_noise) / period
+        (with alpha_noise scaled to the period, see :func:`get_step_noise`)
+
+        Each trace is a pure function of (seed, trace index, parameters): the experiment manifest is enough to
+        regenerate any of them with :func:`regenerate_trace`. Written traces are logged in the experiment folder so an
+        interrupted generation can be resumed: it will skip them and write exactly the same remaining traces.
+
+        An experiment can be split between several nodes: with the same seed, parameters and experiment name, each
+        shard writes the traces whose index modulo shard_count is shard_index (and its own manifest and log). Once all
+        the shards are done and their outputs gathered in the same folder, :func:`merge_shards` checks and combines
+        them. The result does not depend on the number of shards.
+
+        To compare sampling rates, the traces can be simulated once at a fine period and resampled to each of the
+        output_periods: they are then different views of the same random walk.
 
         :param boolean linear_sampling: Should sampling_ratio be used to have a linear sampling (more accurate)
             or be used to compute a discrete sampling step (for back compatibility)
@@ -174,78 +495,79 @@ class Collector:
         :param float sampling_ratio: Percentage (between 0 and 1) of traces to use
         :param float max_speed: The maximum allowed speed in m/s
         :param float min_speed: The minimum allowed speed in m/s
-        :param float alpha_speed: The speed noise range for each step in m/s
-        :param float alpha_noise: The position noise range for each step in m (used for both lon and lat)
+        :param float alpha_speed: The speed noise range for each 1 second step in m/s
+        :param float alpha_noise: The position noise range for each 1 second step in m (used for both lon and lat)
+        :param boolean groundtruth: Should the noiseless positions also be written (same file names and timestamps)
+            under the experiment Groundtruth folder, for :class:`Metrics <p3a_mapwize_pathgenerator.metrics.Metrics>`
+        :param int seed: The experiment seed (drawn from the global numpy random generator if not provided)
+        :param boolean write_traces: Should the traces be written as .plt files (otherwise only the manifest is)
+        :param str experiment: The experiment name (defaults to the current date and time)
+        :param str resume: The name of an interrupted experiment to complete. Its manifest is used and all the other
+            parameters are ignored.
+        :param int shard_index: The shard to generate (between 0 and shard_count - 1)
+        :param int shard_count: The number of shards of the experiment. When greater than 1, seed and experiment are
+            required so that all the shards generate the same experiment
+        :param float period: The simulation sampling period in seconds
+        :param output_periods: Other sampling periods in seconds to also write the traces at, each one in its own
+            folder (see :func:`get_output_folder`). Multiples of period are decimated, others linearly interpolated.
+        :type output_periods: :obj:`list` of :obj:`float`
+        :param venue: The venue routes to read instead of loading the json files, e.g. a
+            :class:`SharedVenue <p3a_mapwize_pathgenerator.venue.SharedVenue>` published once for all the shards of a
+            node (see :func:`get_venue <p3a_mapwize_pathgenerator.venue.get_venue>`)
         """
         args = locals()
-        # Create experiment folder
-        experiment = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
-        os.mkdir(TRACES_PATH + experiment)
-        os.mkdir(TRACES_PATH + experiment + "/Trajectory")
-
-        # Generate paths
-        _, _, paths4, paths4_full = collect_local_data()
-        if linear_sampling:
-            selected_paths4 = random.choice(paths4, int(sampling_ratio * len(paths4)), replace=False)
-        else:
-            sampling = int(len(paths4) / (sampling_ratio * len(paths4)))
-            selected_paths4 = paths4[::sampling]
-        period = 1  # 1 second
-
-        if extend_up_to == -1:
-            # simply loop through sampled paths
-            for path in selected_paths4:
-                # Convert to trace
-                pos, _, _, _ = Collector.follow_path(
-                    path['route'][0]['path'],
-                    alpha_noise=alpha_noise,
-                    alpha_speed=alpha_speed,
-                    min_speed=min_speed,
-                    max_speed=max_speed,
-                    period=period
-                )
-                # Write as file
-                source = path['from']['placeId']
-                dest = path['to']['placeId']
-                Helper.to_plt(pos, period, TRACES_PATH + f"{experiment}/Trajectory/{source}-{dest}.plt")
+        assert 0 <= shard_index < shard_count, f"Invalid shard {shard_index} of {shard_count}"
+        if resume is None and shard_count > 1:
+            assert seed is not None and experiment is not None, \
+                "Invalid arguments: seed and experiment should be provided to all the shards"
+        venue = get_venue(venue)
+        if resume is None:
+            if seed is None:
+                seed = int(random.randint(0, 2 ** 32))
+            params = dict(
+                sampling_ratio=sampling_ratio,
+                linear_sampling=linear_sampling,
+                alpha_noise=alpha_noise,
+                alpha_speed=alpha_speed,
+                min_speed=min_speed,
+                max_speed=max_speed,
+                extend_up_to=extend_up_to,
+                groundtruth=groundtruth,
+                period=period,
+                output_periods=list(output_periods or [])
+            )
+            # Create experiment folder
+            if experiment is None:
+                experiment = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+            # shards can share the same folder
+            for output_period in [None] + params.get('output_periods', []):
+                folder = Collector.get_output_folder("Trajectory", output_period)
+                os.makedirs(TRACES_PATH + f"{experiment}/{folder}", exist_ok=shard_count > 1)
+                if groundtruth:
+                    folder = Collector.get_output_folder("Groundtruth", output_period)
+                    os.makedirs(TRACES_PATH + f"{experiment}/{folder}", exist_ok=shard_count > 1)
+
+            # Generate paths
+            traces = Collector.select_traces(params, venue, seed)
+            manifest = {'seed': seed, 'params': params, 'traces': traces}
+            Helper.to_json(manifest, Collector.get_manifest_file(experiment, shard_index, shard_count))
+            completed = set()
         else:
-            # Loop through construction until we have the expected number of users
-            # During construction, loop through paths until we exceed the expected duration
-            user_cpt = 0
-            # We get a number of expected places to start from (with replacement)
-            place_ids = random.choice(list(paths4_full.keys()), len(selected_paths4), replace=True)
-            while user_cpt < len(place_ids):
-                pos = []
-                current_place_id = place_ids[user_cpt]
-                # Initiate movement tracking variables
-                noise = array([0, 0])
-                speed = 1.3
-                delta_dt = 0
-                while len(pos) < extend_up_to:
-                    # Pick a destination at random
-                    next_place_id = random.choice(list(paths4_full[current_place_id].keys()))
-                    # Convert to trace
-                    new_pos, noise, speed, delta_dt = Collector.follow_path(
-                        paths4_full[current_place_id][next_place_id]['route'][0]['path'],
-                        noise=noise,
-                        speed=speed,
-                        delta_dt=delta_dt,
-                        alpha_noise=alpha_noise,
-                        alpha_speed=alpha_speed,
-                        min_speed=min_speed,
-                        max_speed=max_speed,
-                        period=period
-                    )
-                    if len(pos) > 0 and len(pos) + len(new_pos) > extend_up_to:
-                        # if not empty and we exceed the duration -> stop
-                        break
-                    # else
-                    pos.extend(new_pos)  # [:1] would cumulate the pos noises, thanks to them it's fine without it
-                    # (but might be below min_speed)
-                    current_place_id = next_place_id
-                # Write as file
-                Helper.to_plt(pos, period, TRACES_PATH + f"{experiment}/Trajectory/{user_cpt}.plt")
-                user_cpt += 1
+            experiment = resume
+            manifest = Collector.read_manifest(experiment, shard_index, shard_count)
+            completed = Collector.read_completed(experiment, shard_index, shard_count)
+            print(f"Resuming {experiment}: {len(completed)} traces already written")
+
+        if write_traces or resume is not None:
+            Collector.truncate_completed(experiment, shard_index, shard_count)
+            with open(Collector.get_completed_file(experiment, shard_index, shard_count), 'a') as completed_file:
+                for trace_index in Collector.get_shard_traces(manifest, shard_index, shard_count):
+                    if trace_index in completed:
+                        continue
+                    Collector.write_trace(experiment, trace_index, manifest, venue)
+                    # only log it once its files are complete
+                    completed_file.write(f"{trace_index}\n")
+                    Helper.sync(completed_file)
 
         # save experiment generation data -> Not copied to this project, ask me if needed
         # (no save_to_labbook because it isn't in the primary table anyway so it won't be found by joins)
@@ -256,10 +578,61 @@ class Collector:
 
         return experiment
 
+    @staticmethod
+    def merge_shards(experiment, shard_count):
+        """
+        Checks all the shards generated the same experiment and are complete, then merges their manifests and logs.
+        The shards outputs should have been gathered in the experiment folder. Their statistics are merged by
+        :func:`merge_shards <p3a_mapwize_pathgenerator.stats.Stats.merge_shards>`.
+
+        :param str experiment: The experiment name
+        :param int shard_count: The number of shards of the experiment
+        :return: The merged experiment manifest
+        :rtype: dict
+        """
+        for shard_index in range(shard_count):
+            assert os.path.exists(Collector.get_manifest_file(experiment, shard_index, shard_count)), \
+                f"Shard {shard_index} of {shard_count} has not been generated"
+        manifests = [
+            Collector.read_manifest(experiment, shard_index, shard_count) for shard_index in range(shard_count)
+        ]
+        manifest = manifests[0]
+        for shard_index, shard_manifest in enumerate(manifests):
+            for key in ('seed', 'params', 'traces'):
+                assert shard_manifest[key] == manifest[key], \
+                    f"Shard {shard_index} of {shard_count} has a different {key} than shard 0"
+        params = manifest['params']
+        folders = []
+        for output_period in [None] + params.get('output_periods', []):
+            folders.append(Collector.get_output_folder("Trajectory", output_period))
+            if params['groundtruth']:
+                folders.append(Collector.get_output_folder("Groundtruth", output_period))
+        for shard_index in range(shard_count):
+            expected = set(Collector.get_shard_traces(manifest, shard_index, shard_count))
+            missing = expected - Collector.read_completed(experiment, shard_index, shard_count)
+            assert not missing, f"Shard {shard_index} of {shard_count} is missing {len(missing)} traces"
+        for trace in manifest['traces']:
+            for folder in folders:
+                filename = TRACES_PATH + f"{experiment}/{folder}/{trace['name']}.plt"
+                assert os.path.exists(filename), f"{filename} is missing"
+
+        completed_file = Collector.get_completed_file(experiment)
+        with open(completed_file + ".tmp", "w+") as completed:
+            completed.write("".join(f"{trace_index}\n" for trace_index in range(len(manifest['traces']))))
+        os.replace(completed_file + ".tmp", completed_file)
+        Helper.to_json(manifest, Collector.get_manifest_file(experiment))
+        if shard_count > 1:
+            for shard_index in range(shard_count):
+                os.remove(Collector.get_completed_file(experiment, shard_index, shard_count))
+                os.remove(Collector.get_manifest_file(experiment, shard_index, shard_count))
+        return manifest
+
     @staticmethod
     def clean_experiment(experiment):
         print("Cleaning experiment data", end="\r")
         shutil.rmtree(TRACES_PATH + experiment)
+        if os.path.exists(TRACES_PATH + Collector.get_stats_file(experiment)):
+            os.remove(TRACES_PATH + Collector.get_stats_file(experiment))
         print("Cleaning experiment data: traces folder removed")
 
     @staticmethod
@@ -0,0 +1,130 @@
+import os
+import numpy as np
+
+from p3a_mapwize_pathgenerator.helper import GeolifeFormatHelper
+from p3a_mapwize_pathgenerator.mapwize import Collector
+from p3a_mapwize_pathgenerator.config import TRACES_PATH
+
+
+class Metrics:
+    """
+        Error metrics between generated traces and their ground truth (see the groundtruth option of
+        :func:`generate_experiment <p3a_mapwize_pathgenerator.mapwize.Collector.generate_experiment>`).
+        All the distances are in meters and computed with the vectorized line approximation.
+    """
+
+    @staticmethod
+    def point_errors(pos, groundtruth):
+        """
+        :param pos: The noisy positions (lat, lon)
+        :param groundtruth: The matching noiseless positions (lat, lon)
+        :return: The error of each point in meters
+        :rtype: numpy ndarray
+        """
+        pos, groundtruth = np.asarray(pos, dtype=float), np.asarray(groundtruth, dtype=float)
+        assert pos.shape == groundtruth.shape, f"Trace shapes differ: {pos.shape} vs {groundtruth.shape}"
+        return GeolifeFormatHelper.get_dist_lines(pos, groundtruth)
+
+    @staticmethod
+    def rmse(pos, groundtruth):
+        """
+        :return: The root mean square error between pos and groundtruth in meters
+        :rtype: float
+        """
+        errors = Metrics.point_errors(pos, groundtruth)
+        return float(np.sqrt(np.mean(errors ** 2)))
+
+    @staticmethod
+    def _diagonal_dp(trace1, trace2, combine):
+        """
+        Runs the dynamic programming shared by the discrete Fréchet and the DTW distances.
+        Cells are computed one anti-diagonal at a time: all the cells of a diagonal only depend on the 2 previous
+        ones so each diagonal is a single vectorized step and memory stays in O(len(trace1)).
+
+        :param combine: Function (best previous cost, distances) -> costs of the diagonal cells
+        :return: The cost of the last cell
+        :rtype: float
+        """
+        trace1, trace2 = np.asarray(trace1, dtype=float), np.asarray(trace2, dtype=float)
+        n, m = len(trace1), len(trace2)
+        if n == 0 or m == 0:
+            return np.nan
+        # costs are indexed by row i + 1, index 0 being a padding cell for i = -1
+        previous2 = np.full(n + 1, np.inf)
+        previous1 = np.full(n + 1, np.inf)
+        for k in range(n + m - 1):
+            i = np.arange(max(0, k - m + 1), min(n - 1, k) + 1)
+            distances = GeolifeFormatHelper.get_dist_lines(trace1[i], trace2[k - i])
+            if k == 0:
+                best = np.zeros(1)
+            else:
+                # (i - 1, j), (i, j - 1) are on the previous diagonal, (i - 1, j - 1) on the one before
+                best = np.minimum(np.minimum(previous1[i], previous1[i + 1]), previous2[i])
+            current = previous2  # recycle the buffer, its values have been used above
+            current.fill(np.inf)
+            current[i + 1] = combine(best, distances)
+            previous2, previous1 = previous1, current
+        return float(previous1[n])
+
+    @staticmethod
+    def frechet(trace1, trace2):
+        """
+        :return: The discrete Fréchet distance between both traces in meters
+        :rtype: float
+        """
+        return Metrics._diagonal_dp(trace1, trace2, np.maximum)
+
+    @staticmethod
+    def dtw(trace1, trace2):
+        """
+        :return: The Dynamic Time Warping distance between both traces (sum of the matched distances) in meters
+        :rtype: float
+        """
+        return Metrics._diagonal_dp(trace1, trace2, np.add)
+
+    @staticmethod
+    def experiment_errors(experiment, curves=True):
+        """
+        Streams through the traces of an experiment generated with groundtruth=True and computes the errors.
+        Only one trace (and its ground truth) is loaded at once.
+
+        :param str experiment: The experiment name (as returned by generate_experiment)
+        :param boolean curves: Should the (quadratic) Fréchet and DTW distances also be computed
+        :return: The global statistics and the statistics of each trace (keyed by trace file name)
+        :rtype: (:obj:`dict`, :obj:`dict` of :obj:`dict`)
+        """
+        trajectories_path = TRACES_PATH + f"{experiment}/Trajectory/"
+        groundtruth_path = TRACES_PATH + f"{experiment}/Groundtruth/"
+        assert os.path.isdir(groundtruth_path), f"No ground truth for {experiment}, generate it with groundtruth=True"
+        per_trace = {}
+        n_points, squared_sum, max_error = 0, 0., 0.
+        # skips the temporary files of an interrupted write
+        trace_files = [
+            trace_file for trace_file in sorted(os.listdir(trajectories_path)) if trace_file.endswith(".plt")
+        ]
+        for trace_file in trace_files:
+            trace = Collector.read_file(trajectories_path + trace_file)
+            truth = Collector.read_file(groundtruth_path + trace_file)
+            pos = np.column_stack((np.atleast_1d(trace['lat']), np.atleast_1d(trace['lon'])))
+            clean_pos = np.column_stack((np.atleast_1d(truth['lat']), np.atleast_1d(truth['lon'])))
+            errors = Metrics.point_errors(pos, clean_pos)
+            stats = {
+                'points': len(errors),
+                'mean': float(np.mean(errors)) if len(errors) > 0 else np.nan,
+                'max': float(np.max(errors)) if len(errors) > 0 else 0.,
+                'rmse': float(np.sqrt(np.mean(errors ** 2))) if len(errors) > 0 else np.nan,
+            }
+            if curves:
+                stats['frechet'] = Metrics.frechet(pos, clean_pos)
+                stats['dtw'] = Metrics.dtw(pos, clean_pos)
+            per_trace[trace_file] = stats
+            n_points += len(errors)
+            squared_sum += float(np.sum(errors ** 2))
+            max_error = max(max_error, stats['max'])
+        global_stats = {
+            'traces': len(per_trace),
+            'points': n_points,
+            'rmse': float(np.sqrt(squared_sum / n_points)) if n_points > 0 else np.nan,
+            'max': max_error,
+        }
+        return global_stats, per_trace
@@ -0,0 +1,192 @@
+import heapq
+import json
+import os
+from datetime import datetime
+
+from numpy import array, ceil, log, random
+
+from p3a_mapwize_pathgenerator.helper import Helper
+from p3a_mapwize_pathgenerator.mapwize import Collector
+from p3a_mapwize_pathgenerator.venue import get_venue
+from p3a_mapwize_pathgenerator.config import TRACES_PATH
+
+
+class Scheduler:
+    """
+        Discrete-event simulation of a day in the venue: users arrive (Poisson process, possibly time-varying), walk
+        between places, dwell at them and leave. Events are processed in time order from a heap and only the users in
+        the venue are kept in memory, their trace is written as soon as they leave.
+    """
+    # Event kinds, a user has at most one pending event so (time, user) is a unique and deterministic heap key
+    ARRIVAL = 0
+    WALK_END = 1
+    DWELL_END = 2
+
+    # The .plt time reference
+    START_DATE = datetime(1899, 12, 30)
+    # Seed and parameters of a day experiment. It has no list of traces: unlike a generate_experiment manifest, it
+    # cannot be used to regenerate, resume or merge traces
+    DAY = "day.json"
+
+    @staticmethod
+    def get_day_file(experiment):
+        return TRACES_PATH + f"{experiment}/{Scheduler.DAY}"
+
+    @staticmethod
+    def read_day(experiment):
+        """
+        :param str experiment: The experiment name
+        :return: The day experiment seed, parameters and number of users
+        :rtype: dict
+        """
+        with open(Scheduler.get_day_file(experiment), 'r') as day:
+            return json.load(day)
+
+    @staticmethod
+    def get_arrival_rate(arrival_rate, t, duration):
+        """
+        :param arrival_rate: Users per second, either constant or a list of rates for equal slots of the day
+        :type arrival_rate: :obj:`float` or :obj:`list` of :obj:`float`
+        :param float t: The time in seconds since the start of the day
+        :param float duration: The duration of the day in seconds
+        :return: The arrival rate at time t
+        :rtype: float
+        """
+        if not isinstance(arrival_rate, (list, tuple)):
+            return arrival_rate
+        return arrival_rate[min(int(t / duration * len(arrival_rate)), len(arrival_rate) - 1)]
+
+    @staticmethod
+    def next_arrival(t, arrival_rate, duration, rng):
+        """
+        Draws the next arrival of the (non-homogeneous) Poisson process by thinning.
+
+        :param float t: The last arrival time in seconds since the start of the day
+        :return: The next arrival time (None if after the end of the day)
+        :rtype: float
+        """
+        max_rate = max(arrival_rate) if isinstance(arrival_rate, (list, tuple)) else arrival_rate
+        if max_rate <= 0:
+            return None
+        while True:
+            t -= log(1 - rng.rand()) / max_rate
+            if t >= duration:
+                return None
+            if rng.rand() * max_rate < Scheduler.get_arrival_rate(arrival_rate, t, duration):
+                return t
+
+    @staticmethod
+    def generate_day(duration=8 * 3600, arrival_rate=0.1, mean_dwell=300, leave_probability=0.3,
+                     alpha_noise=0.25, alpha_speed=0.1, min_speed=0.3, max_speed=2, start=datetime(2020, 6, 1, 8),
+                     seed=None, experiment=None, venue=None):
+        """
+        Generates the traces of all the users visiting the venue during a day.
+        Each user enters at a random place, then walks to a random place, where they either leave (with probability
+        leave_probability) or stay for an exponential dwell time (standing still, the sensor keeps sampling the place
+        with the position noise still moving, see :func:`stay <p3a_mapwize_pathgenerator.mapwize.Collector.stay>`)
+        before walking again. All the traces share the same clock so their lifetimes overlap as in the venue.
+
+        :param float duration: Duration of the day in seconds (no arrival after it, users inside finish their visit)
+        :param arrival_rate: Users arriving per second, either constant or a list of rates for equal slots of the day
+            (e.g. one per hour)
+        :type arrival_rate: :obj:`float` or :obj:`list` of :obj:`float`
+        :param float mean_dwell: Mean dwell time at a place in seconds
+        :param float leave_probability: Probability to leave the venue after each walk
+        :param float max_speed: The maximum allowed speed in m/s
+        :param float min_speed: The minimum allowed speed in m/s
+        :param float alpha_speed: The speed noise range for each step in m/s
+        :param float alpha_noise: The position noise range for each step in m (used for both lon and lat)
+        :param datetime start: The start of the day
+        :param int seed: The experiment seed (drawn from the global numpy random generator if not provided), the
+            arrivals use the :attr:`SELECTION_STREAM <p3a_mapwize_pathgenerator.mapwize.Collector.SELECTION_STREAM>`
+            stream and each user its own stream
+        :param str experiment: The experiment name (defaults to the current date and time)
+        :param venue: The venue routes to read instead of loading the json files, e.g. a
+            :class:`SharedVenue <p3a_mapwize_pathgenerator.venue.SharedVenue>` (see
+            :func:`get_venue <p3a_mapwize_pathgenerator.venue.get_venue>`)
+        :return: The experiment name and the simulation statistics (users, events, peak of simultaneous users)
+        :rtype: (:obj:`str`, :obj:`dict`)
+        """
+        if seed is None:
+            seed = int(random.randint(0, 2 ** 32))
+        period = 1  # 1 second
+        params = dict(
+            duration=duration,
+            arrival_rate=arrival_rate,
+            mean_dwell=mean_dwell,
+            leave_probability=leave_probability,
+            alpha_noise=alpha_noise,
+            alpha_speed=alpha_speed,
+            min_speed=min_speed,
+            max_speed=max_speed,
+            start=start.isoformat(),
+            period=period
+        )
+        follow_args = dict(alpha_noise=alpha_noise, alpha_speed=alpha_speed, min_speed=min_speed,
+                           max_speed=max_speed, period=period)
+        # Create experiment folder
+        if experiment is None:
+            experiment = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+        os.mkdir(TRACES_PATH + experiment)
+        os.mkdir(TRACES_PATH + experiment + "/Trajectory")
+
+        venue = get_venue(venue)
+        place_ids = venue.full_sources()
+        start_dt = (start - Scheduler.START_DATE).total_seconds()
+
+        arrivals_rng = Collector.get_rng(seed, Collector.SELECTION_STREAM)
+        events = []
+        first_arrival = Scheduler.next_arrival(0, arrival_rate, duration, arrivals_rng)
+        if first_arrival is not None:
+            heapq.heappush(events, (first_arrival, 0, Scheduler.ARRIVAL))
+        # user -> [rng, arrival time, current place, noise, speed, delta_dt, positions, current place coords]
+        users = {}
+        n_users, n_events, peak = 0, 0, 0
+        while events:
+            t, user, kind = heapq.heappop(events)
+            n_events += 1
+            if kind == Scheduler.ARRIVAL:
+                n_users += 1
+                rng = Collector.get_rng(seed, user)
+                # align the trace on the sampling grid
+                arrival = float(ceil(t / period) * period)
+                users[user] = [rng, arrival, rng.choice(place_ids), array([0, 0]), 1.3, 0, [], None]
+                peak = max(peak, len(users))
+                # the user starts walking right away
+                kind = Scheduler.DWELL_END
+                next_arrival = Scheduler.next_arrival(t, arrival_rate, duration, arrivals_rng)
+                if next_arrival is not None:
+                    heapq.heappush(events, (next_arrival, user + 1, Scheduler.ARRIVAL))
+
+            state = users[user]
+            rng, arrival, place_id, noise, speed, delta_dt, pos, _ = state
+            if kind == Scheduler.DWELL_END:
+                # Walk to a destination picked at random
+                next_place_id = rng.choice(venue.full_destinations(place_id))
+                path = venue.full_path(place_id, next_place_id)
+                new_pos, noise, speed, delta_dt = Collector.follow_path(
+                    path,
+                    noise=noise,
+                    speed=speed,
+                    delta_dt=delta_dt,
+                    rng=rng,
+                    **follow_args
+                )
+                pos.extend(new_pos)
+                state[2:6] = next_place_id, noise, speed, delta_dt
+                state[7] = array(path[-1])
+                heapq.heappush(events, (arrival + len(pos) * period, user, Scheduler.WALK_END))
+            elif rng.rand() < leave_probability:
+                # WALK_END: leave the venue
+                Helper.to_plt(pos, period, TRACES_PATH + f"{experiment}/Trajectory/{user}.plt", start_dt + arrival)
+                del users[user]
+            else:
+                # WALK_END: stay at the place, the sensor keeps sampling the (noisy) position
+                n_dwell = int(ceil(-log(1 - rng.rand()) * mean_dwell / period))
+                new_pos, state[3] = Collector.stay(state[7], noise, n_dwell, alpha_noise, rng)
+                pos.extend(new_pos)
+                state[5] = 0  # the next walk starts from the place
+                heapq.heappush(events, (arrival + len(pos) * period, user, Scheduler.DWELL_END))
+
+        Helper.to_json({'seed': seed, 'params': params, 'users': n_users}, Scheduler.get_day_file(experiment))
+        return experiment, {'users': n_users, 'events': n_events, 'peak': peak}
@@ -0,0 +1,225 @@
+import json
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from p3a_mapwize_pathgenerator.helper import Helper, GeolifeFormatHelper
+from p3a_mapwize_pathgenerator.mapwize import Collector
+from p3a_mapwize_pathgenerator.scheduler import Scheduler
+from p3a_mapwize_pathgenerator.config import TRACES_PATH
+
+
+class Stats:
+    """
+        Speed, step length, duration and number of points statistics of the traces of an experiment, used to filter
+        out the traces exceeding the speed limit. Traces are read in parallel, one at a time per worker, and only
+        their summaries and fixed-bins histograms are kept.
+    """
+    # Histograms bins edges, the last bin gathers everything above
+    SPEED_BINS = np.linspace(0, 10, 101)  # m/s
+    STEP_BINS = np.linspace(0, 20, 201)  # m
+
+    @staticmethod
+    def read_positions(filename):
+        """
+        Faster alternative to :func:`read_file <p3a_mapwize_pathgenerator.mapwize.Collector.read_file>` only parsing
+        the positions and times.
+
+        :param str filename: The absolute path to the .plt file
+        :return: The positions (lat, lon) and the times in seconds
+        :rtype: (numpy ndarray of shape (n, 2), numpy ndarray of shape (n,))
+        """
+        data = np.loadtxt(filename, delimiter=',', usecols=(0, 1, 4), skiprows=6, ndmin=2)
+        # rounded to the millisecond to handle sub-second sampling periods
+        return data[:, :2], np.round(data[:, 2] * 24 * 3600, 3)
+
+    @staticmethod
+    def histogram(values, bins):
+        return np.histogram(np.minimum(values, bins[-1]), bins)[0]
+
+    @staticmethod
+    def trace_stats(filename):
+        """
+        :param str filename: The absolute path to the .plt file
+        :return: The trace summary and its speed and step length histograms
+        :rtype: (:obj:`dict`, numpy ndarray, numpy ndarray)
+        """
+        pos, times = Stats.read_positions(filename)
+        steps = GeolifeFormatHelper.get_dist_lines(pos[:-1], pos[1:])
+        speeds = steps / np.diff(times)
+        summary = {
+            'points': len(pos),
+            'duration': float(times[-1] - times[0]) if len(pos) > 0 else 0.,
+            'length': float(np.sum(steps)),
+            'max_step': float(np.max(steps)) if len(steps) > 0 else 0.,
+            'max_speed': float(np.max(speeds)) if len(speeds) > 0 else 0.,
+            'speed_sum': float(np.sum(speeds)),
+            'speed_squared_sum': float(np.sum(speeds ** 2)),
+        }
+        return summary, Stats.histogram(speeds, Stats.SPEED_BINS), Stats.histogram(steps, Stats.STEP_BINS)
+
+    @staticmethod
+    def _named_trace_stats(filename):
+        return os.path.basename(filename), Stats.trace_stats(filename)
+
+    @staticmethod
+    def aggregate(traces, speed_histogram, step_histogram, max_speed=None):
+        """
+        Computes the global statistics from the traces summaries. Summaries are summed in name order so the result
+        does not depend on the order in which traces were processed.
+
+        :param traces: The summaries of the traces by name (see :func:`trace_stats`)
+        :type traces: :obj:`dict` of :obj:`dict`
+        :param max_speed: The speed limit of the experiment, if known
+        :return: The global statistics
+        :rtype: dict
+        """
+        names = sorted(traces)
+        points = np.array([traces[name]['points'] for name in names], dtype=float)
+        durations = np.array([traces[name]['duration'] for name in names])
+        n_steps = int(np.sum(np.maximum(points - 1, 0)))
+        speed_sum = sum(traces[name]['speed_sum'] for name in names)
+        speed_squared_sum = sum(traces[name]['speed_squared_sum'] for name in names)
+        speed_mean = speed_sum / n_steps if n_steps > 0 else np.nan
+        global_stats = {
+            'traces': len(names),
+            'steps': n_steps,
+            'speed': {
+                'mean': speed_mean,
+                'std': float(np.sqrt(max(speed_squared_sum / n_steps - speed_mean ** 2, 0))) if n_steps > 0 else np.nan,
+                'max': max((traces[name]['max_speed'] for name in names), default=0.),
+                'bins': Stats.SPEED_BINS.tolist(),
+                'histogram': np.asarray(speed_histogram).tolist(),
+            },
+            'step': {
+                'mean': sum(traces[name]['length'] for name in names) / n_steps if n_steps > 0 else np.nan,
+                'max': max((traces[name]['max_step'] for name in names), default=0.),
+                'bins': Stats.STEP_BINS.tolist(),
+                'histogram': np.asarray(step_histogram).tolist(),
+            },
+        }
+        for key, values in (('duration', durations), ('points', points)):
+            global_stats[key] = {
+                'mean': float(np.mean(values)) if len(values) > 0 else np.nan,
+                'std': float(np.std(values)) if len(values) > 0 else np.nan,
+                'min': float(np.min(values)) if len(values) > 0 else np.nan,
+                'max': float(np.max(values)) if len(values) > 0 else np.nan,
+            }
+        if max_speed is not None:
+            global_stats['max_speed_limit'] = max_speed
+            global_stats['over_max_speed'] = [name for name in names if traces[name]['max_speed'] >= max_speed]
+        return global_stats
+
+    @staticmethod
+    def compute_experiment_stats(experiment, processes=None, chunksize=16, shard_index=0, shard_count=1):
+        """
+        Scans the traces of an experiment in parallel and writes their statistics as json in the experiment stats file
+        (see :func:`get_stats_file <p3a_mapwize_pathgenerator.mapwize.Collector.get_stats_file>`).
+
+        :param str experiment: The experiment name
+        :param int processes: The number of worker processes (defaults to the number of cpus, 1 to stay in process)
+        :param int chunksize: The number of traces sent to a worker at once
+        :param int shard_index: Only compute the statistics of the traces of this shard, in its own stats file (see
+            :func:`generate_experiment <p3a_mapwize_pathgenerator.mapwize.Collector.generate_experiment>`)
+        :param int shard_count: The number of shards of the experiment
+        :return: The statistics: 'global' ones and the summary of each trace under 'traces'
+        :rtype: dict
+        """
+        trajectories_path = TRACES_PATH + f"{experiment}/Trajectory/"
+        if shard_count == 1:
+            filenames = [
+                trajectories_path + trace_file
+                for trace_file in sorted(os.listdir(trajectories_path)) if trace_file.endswith(".plt")
+            ]
+        else:
+            manifest = Collector.read_manifest(experiment, shard_index, shard_count)
+            filenames = [
+                trajectories_path + f"{manifest['traces'][trace_index]['name']}.plt"
+                for trace_index in Collector.get_shard_traces(manifest, shard_index, shard_count)
+            ]
+        traces = {}
+        speed_histogram = np.zeros(len(Stats.SPEED_BINS) - 1, dtype=int)
+        step_histogram = np.zeros(len(Stats.STEP_BINS) - 1, dtype=int)
+        if processes == 1:
+            results = map(Stats._named_trace_stats, filenames)
+            pool = None
+        else:
+            pool = Pool(processes)
+            results = pool.imap_unordered(Stats._named_trace_stats, filenames, chunksize)
+        try:
+            for name, (summary, trace_speed_histogram, trace_step_histogram) in results:
+                traces[name] = summary
+                speed_histogram += trace_speed_histogram
+                step_histogram += trace_step_histogram
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        stats = {
+            'global': Stats.aggregate(
+                traces, speed_histogram, step_histogram, Stats.get_max_speed(experiment, shard_index, shard_count)
+            ),
+            'traces': traces,
+        }
+        suffix = Collector.get_shard_suffix(shard_index, shard_count)
+        Helper.to_json(stats, TRACES_PATH + Collector.get_stats_file(experiment + suffix))
+        return stats
+
+    @staticmethod
+    def get_max_speed(experiment, shard_index=0, shard_count=1):
+        """
+        :param str experiment: The experiment name
+        :param int shard_index: The shard whose manifest to read
+        :param int shard_count: The number of shards of the experiment
+        :return: The speed limit of the experiment, to filter out traces (None if it has no manifest or day file)
+        :rtype: float
+        """
+        if os.path.exists(Collector.get_manifest_file(experiment, shard_index, shard_count)):
+            params = Collector.read_manifest(experiment, shard_index, shard_count)['params']
+        elif os.path.exists(Scheduler.get_day_file(experiment)):
+            params = Scheduler.read_day(experiment)['params']
+        else:
+            return None
+        # resampled traces are also below the limit of the simulation period
+        alpha_noise = Collector.get_step_noise(params['alpha_noise'], params['period'])
+        return Collector.max_speed(params['max_speed'], alpha_noise, params['period'])
+
+    @staticmethod
+    def merge_shards(experiment, shard_count):
+        """
+        Combines the statistics computed by each shard in the experiment stats file and removes the shards ones.
+        The shards should have been merged first (see
+        :func:`merge_shards <p3a_mapwize_pathgenerator.mapwize.Collector.merge_shards>`).
+        The result is the same as computing the statistics of the whole experiment.
+
+        :param str experiment: The experiment name
+        :param int shard_count: The number of shards of the experiment
+        :return: The statistics of the experiment
+        :rtype: dict
+        """
+        shards_stats_files = [
+            TRACES_PATH + Collector.get_stats_file(experiment + Collector.get_shard_suffix(shard_index, shard_count))
+            for shard_index in range(shard_count)
+        ]
+        traces = {}
+        speed_histogram = np.zeros(len(Stats.SPEED_BINS) - 1, dtype=int)
+        step_histogram = np.zeros(len(Stats.STEP_BINS) - 1, dtype=int)
+        for stats_file in shards_stats_files:
+            assert os.path.exists(stats_file), f"{stats_file} is missing, compute the statistics of all the shards"
+            with open(stats_file, 'r') as file:
+                shard_stats = json.load(file)
+            assert not traces.keys() & shard_stats['traces'].keys(), f"{stats_file} overlaps another shard"
+            traces.update(shard_stats['traces'])
+            speed_histogram += shard_stats['global']['speed']['histogram']
+            step_histogram += shard_stats['global']['step']['histogram']
+        stats = {
+            'global': Stats.aggregate(traces, speed_histogram, step_histogram, Stats.get_max_speed(experiment)),
+            'traces': traces,
+        }
+        Helper.to_json(stats, TRACES_PATH + Collector.get_stats_file(experiment))
+        if shard_count > 1:
+            for stats_file in shards_stats_files:
+                os.remove(stats_file)
+        return stats
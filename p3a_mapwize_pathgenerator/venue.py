@@ -0,0 +1,312 @@
+import json
+
+import numpy as np
+
+from p3a_mapwize_pathgenerator.config import DATA_PATH
+
+
+def collect_local_data():
+    with open(f'{DATA_PATH}places.json', 'r') as places:
+        places = json.load(places)
+    with open(f'{DATA_PATH}path.json', 'r') as path:
+        path = json.load(path)
+    with open(f'{DATA_PATH}paths_4_floor.json', 'r') as paths4:
+        paths4 = json.load(paths4)
+    with open(f'{DATA_PATH}paths_4_floor_full.json', 'r') as paths4_full:
+        paths4_full = json.load(paths4_full)
+    print("Data loaded...")
+    return places, path, paths4, paths4_full
+
+
+def get_venue(data=None):
+    """
+    :param data: Either (paths4, paths4_full) from :func:`collect_local_data`, a :class:`LocalVenue` or a
+        :class:`SharedVenue` (the json files are loaded if not provided)
+    :return: The venue routes with the :class:`SharedVenue` accessors
+    :rtype: :obj:`LocalVenue` or :obj:`SharedVenue`
+    """
+    if data is None:
+        _, _, paths4, paths4_full = collect_local_data()
+        return LocalVenue(paths4, paths4_full)
+    if isinstance(data, (LocalVenue, SharedVenue)):
+        return data
+    return LocalVenue(*data)
+
+
+class LocalVenue:
+    """
+        The venue routes of the json files (paths4 and paths4_full from :func:`collect_local_data`) behind the same
+        accessors as :class:`SharedVenue`, so that the generation reads either of them.
+    """
+
+    def __init__(self, paths4, paths4_full):
+        self.paths4 = paths4
+        self.paths4_full = paths4_full
+
+    @property
+    def n_paths(self):
+        return len(self.paths4)
+
+    def path(self, path_index):
+        path = self.paths4[path_index]
+        return path['route'][0]['path'], path['from']['placeId'], path['to']['placeId']
+
+    def full_sources(self):
+        return list(self.paths4_full.keys())
+
+    def full_destinations(self, source_id):
+        return list(self.paths4_full[source_id].keys())
+
+    def full_path(self, source_id, destination_id):
+        return self.paths4_full[source_id][destination_id]['route'][0]['path']
+
+
+class SharedVenue:
+    """
+        The venue (places metadata from places.json, and paths4 and paths4_full routes from
+        :func:`collect_local_data`) published once as flat arrays in a shared memory segment. Other processes attach
+        to it by name and get read-only numpy views of the same memory: no json parsing and no copy per process.
+
+        Layout: a header with the sizes, then the arrays of :func:`_layout`. Routes are stored one after the other in
+        coords (route i is coords[route_offsets[i]:route_offsets[i + 1]]): first the paths4 ones, then the paths4_full
+        ones grouped by source place (sources and their destinations keep the paths4_full order). The places are the
+        ones of places.json and of the routes, sorted by id; place i has the floor place_floors[i], the marker
+        place_markers[i] and the geometry
+        place_geometries[place_geometry_offsets[i]:place_geometry_offsets[i + 1]] (NaN and empty if unknown).
+    """
+    HEADER = ('place_id_width', 'n_places', 'n_geometry_coords', 'n_routes', 'n_coords', 'n_paths4', 'n_sources')
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        header = np.ndarray((len(SharedVenue.HEADER),), dtype=np.int64, buffer=shm.buf)
+        self.sizes = dict(zip(SharedVenue.HEADER, (int(size) for size in header)))
+        for field, dtype, shape, offset in SharedVenue._layout(self.sizes)[0]:
+            array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            array.flags.writeable = owner  # only the publisher fills the arrays
+            setattr(self, field, array)
+        self._place_indexes = None
+
+    @staticmethod
+    def _layout(sizes):
+        """
+        :param dict sizes: The header values
+        :return: The (field, dtype, shape, offset) of each array and the total size in bytes
+        :rtype: (:obj:`list` of :obj:`tuple`, :obj:`int`)
+        """
+        arrays = [
+            # wide enough for the longest id of the published venue
+            ('place_ids', f"S{sizes['place_id_width']}", (sizes['n_places'],)),
+            ('place_floors', np.float64, (sizes['n_places'],)),
+            ('place_markers', np.float64, (sizes['n_places'], 2)),
+            ('place_geometry_offsets', np.int64, (sizes['n_places'] + 1,)),
+            ('place_geometries', np.float64, (sizes['n_geometry_coords'], 2)),
+            ('coords', np.float64, (sizes['n_coords'], 2)),
+            ('route_offsets', np.int64, (sizes['n_routes'] + 1,)),
+            ('route_from', np.int32, (sizes['n_routes'],)),
+            ('route_to', np.int32, (sizes['n_routes'],)),
+            ('sources', np.int32, (sizes['n_sources'],)),
+            ('source_offsets', np.int64, (sizes['n_sources'] + 1,)),
+        ]
+        layout = []
+        offset = len(SharedVenue.HEADER) * np.dtype(np.int64).itemsize
+        for field, dtype, shape in arrays:
+            layout.append((field, dtype, shape, offset))
+            offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+            offset += -offset % 8  # keep the next array aligned
+        return layout, offset
+
+    @staticmethod
+    def get_geometry(place):
+        """
+        :param dict place: A place of places.json
+        :return: The coords (lat, lon) of the place geometry: the outer ring of a polygon or a single point
+        :rtype: numpy ndarray of shape (n, 2)
+        """
+        geometry = place.get('geometry') or {}
+        if geometry.get('type') == 'Polygon':
+            coords = geometry['coordinates'][0]
+        elif geometry.get('type') == 'Point':
+            coords = [geometry['coordinates']]
+        else:
+            coords = []
+        # GeoJSON coords are (lon, lat)
+        return np.asarray(coords, dtype=np.float64).reshape(-1, 2)[:, ::-1]
+
+    @staticmethod
+    def publish(name=None, data=None):
+        """
+        Copies the venue in a new shared memory segment. The publisher should keep the returned object alive while
+        workers use it, then :func:`close` and :func:`unlink` it.
+
+        :param str name: The segment name (a random one if not provided)
+        :param data: Optional (places, paths4, paths4_full) to avoid reloading them
+        :return: The published venue, its name is the one to give to :func:`attach`
+        :rtype: SharedVenue
+        """
+        from multiprocessing import shared_memory  # python >= 3.8, only needed to share the venue
+
+        if data is None:
+            places, _, paths4, paths4_full = collect_local_data()
+        else:
+            places, paths4, paths4_full = data
+        routes = [(path['from']['placeId'], path['to']['placeId'], path) for path in paths4]
+        for source, destinations in paths4_full.items():
+            routes.extend((source, destination, path) for destination, path in destinations.items())
+        places = {place['_id']: place for place in places}
+        place_ids = sorted(
+            places.keys() | {place_id for source, destination, _ in routes for place_id in (source, destination)}
+        )
+        place_indexes = {place_id: i for i, place_id in enumerate(place_ids)}
+        geometries = [SharedVenue.get_geometry(places.get(place_id, {})) for place_id in place_ids]
+        coords = [np.asarray(path['route'][0]['path'], dtype=np.float64).reshape(-1, 2) for _, _, path in routes]
+
+        sizes = {
+            'place_id_width': max((len(place_id.encode()) for place_id in place_ids), default=1),
+            'n_places': len(place_ids),
+            'n_geometry_coords': sum(len(geometry) for geometry in geometries),
+            'n_routes': len(routes),
+            'n_coords': sum(len(route_coords) for route_coords in coords),
+            'n_paths4': len(paths4),
+            'n_sources': len(paths4_full),
+        }
+        _, size = SharedVenue._layout(sizes)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        np.ndarray((len(SharedVenue.HEADER),), dtype=np.int64, buffer=shm.buf)[:] = [
+            sizes[key] for key in SharedVenue.HEADER
+        ]
+        venue = SharedVenue(shm, owner=True)
+        venue.place_ids[:] = [place_id.encode() for place_id in place_ids]
+        for i, place_id in enumerate(place_ids):
+            place = places.get(place_id, {})
+            venue.place_floors[i] = np.nan if place.get('floor') is None else place['floor']
+            marker = place.get('marker')
+            venue.place_markers[i] = (marker['latitude'], marker['longitude']) if marker else (np.nan, np.nan)
+        venue.place_geometry_offsets[0] = 0
+        np.cumsum([len(geometry) for geometry in geometries], out=venue.place_geometry_offsets[1:])
+        venue.place_geometries[:] = np.concatenate(geometries) if geometries else np.empty((0, 2))
+        venue.coords[:] = np.concatenate(coords) if coords else np.empty((0, 2))
+        venue.route_offsets[0] = 0
+        np.cumsum([len(route_coords) for route_coords in coords], out=venue.route_offsets[1:])
+        venue.route_from[:] = [place_indexes[source] for source, _, _ in routes]
+        venue.route_to[:] = [place_indexes[destination] for _, destination, _ in routes]
+        venue.sources[:] = [place_indexes[source] for source in paths4_full]
+        venue.source_offsets[0] = len(paths4)
+        np.cumsum([len(destinations) for destinations in paths4_full.values()], out=venue.source_offsets[1:])
+        venue.source_offsets[1:] += len(paths4)
+        return venue
+
+    @staticmethod
+    def attach(name):
+        """
+        :param str name: The name of a segment created by :func:`publish`
+        :return: Read-only views of the published venue
+        :rtype: SharedVenue
+        """
+        from multiprocessing import shared_memory, resource_tracker
+
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)  # python >= 3.13
+        except TypeError:
+            # Otherwise the segment would be destroyed when this process exits, the publisher owns it. Registering then
+            # unregistering is not enough: forked workers share the publisher tracker and would remove its registration
+            register = resource_tracker.register
+            resource_tracker.register = lambda *args, **kwargs: None
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        return SharedVenue(shm, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def n_paths(self):
+        return self.sizes['n_paths4']
+
+    def place_id(self, place_index):
+        return self.place_ids[place_index].decode()
+
+    def place_index(self, place_id):
+        if self._place_indexes is None:
+            self._place_indexes = {place_id.decode(): i for i, place_id in enumerate(self.place_ids)}
+        return self._place_indexes[place_id]
+
+    def place(self, place_id):
+        """
+        :param str place_id: A place id
+        :return: The place floor (None if unknown), marker (lat, lon) and geometry coords (lat, lon), views of the
+            shared memory
+        :rtype: dict
+        """
+        place_index = self.place_index(place_id)
+        floor = self.place_floors[place_index]
+        geometry_start, geometry_end = self.place_geometry_offsets[place_index:place_index + 2]
+        return {
+            'floor': None if np.isnan(floor) else float(floor),
+            'marker': self.place_markers[place_index],
+            'geometry': self.place_geometries[geometry_start:geometry_end],
+        }
+
+    def route(self, route_index):
+        """
+        :return: The coords (lat, lon) of the route, a view of the shared memory
+        :rtype: numpy ndarray of shape (n, 2)
+        """
+        return self.coords[self.route_offsets[route_index]:self.route_offsets[route_index + 1]]
+
+    def path(self, path_index):
+        """
+        :return: The coords of paths4[path_index]['route'][0]['path'], and its source and destination place ids
+        :rtype: (numpy ndarray of shape (n, 2), :obj:`str`, :obj:`str`)
+        """
+        assert 0 <= path_index < self.n_paths, f"No path {path_index}"
+        return self.route(path_index), self.place_id(self.route_from[path_index]), \
+            self.place_id(self.route_to[path_index])
+
+    def full_sources(self):
+        """
+        :return: The source place ids, in the paths4_full keys order
+        :rtype: :obj:`list` of :obj:`str`
+        """
+        return [self.place_id(place_index) for place_index in self.sources]
+
+    def full_routes(self, source_id):
+        """
+        :param str source_id: A source place id
+        :return: The indexes of the routes from source_id, in the paths4_full[source_id] keys order
+        :rtype: range
+        """
+        source = int(np.flatnonzero(self.sources == self.place_index(source_id))[0])
+        return range(self.source_offsets[source], self.source_offsets[source + 1])
+
+    def full_destinations(self, source_id):
+        """
+        :return: The destination place ids from source_id, in the paths4_full[source_id] keys order
+        :rtype: :obj:`list` of :obj:`str`
+        """
+        return [self.place_id(self.route_to[route_index]) for route_index in self.full_routes(source_id)]
+
+    def full_path(self, source_id, destination_id):
+        """
+        :return: The coords of paths4_full[source_id][destination_id]['route'][0]['path']
+        :rtype: numpy ndarray of shape (n, 2)
+        """
+        destination = self.place_index(destination_id)
+        for route_index in self.full_routes(source_id):
+            if self.route_to[route_index] == destination:
+                return self.route(route_index)
+        raise KeyError(f"No path from {source_id} to {destination_id}")
+
+    def close(self):
+        """ Releases the views and detaches from the segment """
+        for field, _, _, _ in SharedVenue._layout(self.sizes)[0]:
+            delattr(self, field)
+        self.shm.close()
+
+    def unlink(self):
+        """ Destroys the segment (publisher only, once all the workers are done) """
+        assert self.owner, "Only the publisher should destroy the shared venue"
+        self.shm.unlink()
@@ -1,11 +1,22 @@
+import os
+import subprocess
+from multiprocessing import Pool
+from datetime import datetime
+import sys
 import unittest
-from numpy import array, random, mean
+from numpy import array, random, mean, atleast_1d, diff
+from numpy.testing import assert_array_equal
 import matplotlib.pyplot as plt
 
 from p3a_mapwize_pathgenerator.helper import Helper, GeolifeFormatHelper
 from p3a_mapwize_pathgenerator.display import collect_local_data, display_floors, display_path, display_together
 from p3a_mapwize_pathgenerator.config import TRACES_PATH
 from p3a_mapwize_pathgenerator.mapwize import Collector
+from p3a_mapwize_pathgenerator.cli import main
+from p3a_mapwize_pathgenerator.scheduler import Scheduler
+from p3a_mapwize_pathgenerator.stats import Stats
+from p3a_mapwize_pathgenerator.venue import LocalVenue, SharedVenue
+from p3a_mapwize_pathgenerator.metrics import Metrics
 
 
 class TestIntegration(unittest.TestCase):
@@ -78,10 +89,8 @@ class TestIntegration(unittest.TestCase):
         plt.show()
 
         # Compute the average difference in positions
-        diffs = []
-        for i in range(min(len(pos), len(pos2))):
-            diffs.append(GeolifeFormatHelper.get_dist_line(pos[i], pos2[i]))
-        diffs = array(diffs)
+        n = min(len(pos), len(pos2))
+        diffs = Metrics.point_errors(pos[:n], pos2[:n])
         print(diffs)
         print(mean(diffs))
 
@@ -96,3 +105,317 @@ class TestIntegration(unittest.TestCase):
         plt.show()
 
         Helper.to_plt(pos3, 1, TRACES_PATH + "file.plt")
+
+    def test_groundtruth_metrics(self):
+        """ Ground truth export and error metrics """
+        random.seed(0)
+        pos, _, _, _, clean_pos = Collector.follow_direction(
+            array([0, 0]),
+            array([60, 80]) * GeolifeFormatHelper.EQUATOR_METERS_TO_DEGREES,
+            array([0, 0]),
+            1.3,
+            groundtruth=True
+        )
+        self.assertEqual(pos.shape, clean_pos.shape)
+        # The first point has no noise yet
+        self.assertEqual(Metrics.point_errors(pos, clean_pos)[0], 0)
+        self.assertEqual(Metrics.frechet(pos, pos), 0)
+        self.assertEqual(Metrics.dtw(pos, pos), 0)
+        # Matching the points one to one is one of the couplings considered by Fréchet and DTW
+        errors = Metrics.point_errors(pos, clean_pos)
+        self.assertLessEqual(Metrics.frechet(pos, clean_pos), errors.max())
+        self.assertLessEqual(Metrics.dtw(pos, clean_pos), errors.sum() + 1e-6)
+
+        experiment = Collector.generate_experiment(linear_sampling=True, alpha_noise=1, groundtruth=True)
+        try:
+            # A trace without points and the leftover of an interrupted write
+            for folder in ("Trajectory", "Groundtruth"):
+                Helper.to_plt([], 1, TRACES_PATH + f"{experiment}/{folder}/empty.plt", 0)
+            with open(TRACES_PATH + f"{experiment}/Trajectory/interrupted.plt.tmp", "w") as interrupted:
+                interrupted.write("Offset line 1\n")
+            global_stats, per_trace = Metrics.experiment_errors(experiment)
+            self.assertEqual(global_stats['traces'], len(per_trace))
+            self.assertGreater(global_stats['rmse'], 0)
+            self.assertNotIn("interrupted.plt.tmp", per_trace)
+            self.assertEqual(per_trace.pop("empty.plt")['points'], 0)
+            for stats in per_trace.values():
+                self.assertLessEqual(stats['frechet'], stats['max'] + 1e-6)
+        finally:
+            Collector.clean_experiment(experiment)
+
+    def test_regenerate_trace(self):
+        """ Traces are pure functions of (seed, trace index, parameters) """
+        experiment = Collector.generate_experiment(linear_sampling=True, extend_up_to=50, seed=42,
+                                                   experiment="test_regenerate_trace")
+        try:
+            manifest = Collector.read_manifest(experiment)
+            self.assertEqual(manifest['seed'], 42)
+            _, _, paths4, paths4_full = collect_local_data()
+            # Regenerate the traces in reverse order, each one in isolation
+            for trace_index in reversed(range(len(manifest['traces']))):
+                pos, clean_pos = Collector.regenerate_trace(experiment, trace_index, (paths4, paths4_full))
+                self.assertIsNone(clean_pos)
+                trace = Collector.read_file(
+                    TRACES_PATH + f"{experiment}/Trajectory/{manifest['traces'][trace_index]['name']}.plt"
+                )
+                assert_array_equal(array(pos)[:, 0], trace['lat'])
+                assert_array_equal(array(pos)[:, 1], trace['lon'])
+        finally:
+            Collector.clean_experiment(experiment)
+
+    def test_resume_experiment(self):
+        """ An interrupted experiment is completed with exactly the same traces """
+        experiment = Collector.generate_experiment(linear_sampling=True, groundtruth=True, seed=7,
+                                                   experiment="test_resume_experiment")
+        try:
+            trajectories_path = TRACES_PATH + f"{experiment}/Trajectory/"
+            expected = {}
+            for trace_file in os.listdir(trajectories_path):
+                with open(trajectories_path + trace_file) as file:
+                    expected[trace_file] = file.read()
+            manifest = Collector.read_manifest(experiment)
+            self.assertEqual(Collector.read_completed(experiment), set(range(len(manifest['traces']))))
+
+            # Simulate a run killed after 10 traces, while logging the 11th
+            for trace in manifest['traces'][10:]:
+                os.remove(trajectories_path + f"{trace['name']}.plt")
+            with open(Collector.get_completed_file(experiment), 'w') as completed:
+                completed.write("".join(f"{i}\n" for i in range(10)) + "1")
+            self.assertEqual(Collector.read_completed(experiment), set(range(10)))
+            # Manifests written before the output periods were supported don't have them
+            del manifest['params']['output_periods']
+            Helper.to_json(manifest, Collector.get_manifest_file(experiment))
+
+            self.assertEqual(Collector.generate_experiment(resume=experiment), experiment)
+            # The torn line was dropped and every trace logged once
+            with open(Collector.get_completed_file(experiment)) as completed:
+                self.assertEqual(completed.read(), "".join(f"{i}\n" for i in range(len(manifest['traces']))))
+            self.assertEqual(sorted(os.listdir(trajectories_path)), sorted(expected))
+            for trace_file, content in expected.items():
+                with open(trajectories_path + trace_file) as file:
+                    self.assertEqual(file.read(), content)
+        finally:
+            Collector.clean_experiment(experiment)
+
+    def test_cli(self):
+        """ The command line generation does not import the display dependencies """
+        imported = subprocess.run(
+            [sys.executable, "-c", "import sys, p3a_mapwize_pathgenerator.cli; print(sorted(sys.modules))"],
+            stdout=subprocess.PIPE, universal_newlines=True, check=True
+        ).stdout
+        self.assertNotIn("matplotlib", imported)
+        self.assertNotIn("geopy", imported)
+
+        main(["generate", "--linear-sampling", "--seed", "3", "--experiment", "test_cli", "--manifest-only"])
+        try:
+            manifest = Collector.read_manifest("test_cli")
+            self.assertEqual(manifest['seed'], 3)
+            self.assertEqual(os.listdir(TRACES_PATH + "test_cli/Trajectory"), [])
+        finally:
+            Collector.clean_experiment("test_cli")
+
+    def test_generate_day(self):
+        """ Users with overlapping lifetimes on a shared clock """
+        experiment, stats = Scheduler.generate_day(duration=600, arrival_rate=[0.02, 0.05], mean_dwell=30, seed=5,
+                                                   experiment="test_generate_day")
+        try:
+            trajectories_path = TRACES_PATH + f"{experiment}/Trajectory/"
+            self.assertEqual(len(os.listdir(trajectories_path)), stats['users'])
+            self.assertGreater(stats['peak'], 1)
+            self.assertEqual(Scheduler.read_day(experiment)['users'], stats['users'])
+            self.assertFalse(os.path.exists(Collector.get_manifest_file(experiment)))
+            self.assertEqual(Stats.compute_experiment_stats(experiment, processes=1)['global']['over_max_speed'], [])
+            day_start = (datetime(2020, 6, 1, 8) - Scheduler.START_DATE).total_seconds()
+            for trace_file in os.listdir(trajectories_path):
+                trace = Collector.read_file(trajectories_path + trace_file)
+                times = array([GeolifeFormatHelper.get_time_s(t) for t in atleast_1d(trace['timestamp'])])
+                # Sampled every second from an arrival during the day
+                self.assertTrue((diff(times) == 1).all())
+                self.assertTrue(0 <= times[0] - day_start <= 600)
+                # The noise keeps moving while users dwell: no frozen position
+                lat, lon = atleast_1d(trace['lat']), atleast_1d(trace['lon'])
+                self.assertFalse(((diff(lat) == 0) & (diff(lon) == 0)).any())
+        finally:
+            Collector.clean_experiment(experiment)
+
+    def test_experiment_stats(self):
+        """ Parallel statistics of an experiment """
+        experiment = Collector.generate_experiment(linear_sampling=True, alpha_noise=1, seed=11,
+                                                   experiment="test_experiment_stats")
+        try:
+            stats = Stats.compute_experiment_stats(experiment, processes=2, chunksize=2)
+            self.assertTrue(os.path.exists(TRACES_PATH + Collector.get_stats_file(experiment)))
+            self.assertEqual(stats, Stats.compute_experiment_stats(experiment, processes=1))
+            global_stats = stats['global']
+            self.assertEqual(global_stats['traces'], len(Collector.read_manifest(experiment)['traces']))
+            self.assertEqual(sum(global_stats['speed']['histogram']), global_stats['steps'])
+            # The generator guarantees the speed limit
+            self.assertEqual(global_stats['over_max_speed'], [])
+            self.assertLess(global_stats['speed']['max'], global_stats['max_speed_limit'])
+            for summary in stats['traces'].values():
+                self.assertEqual(summary['duration'], summary['points'] - 1)
+        finally:
+            Collector.clean_experiment(experiment)
+        self.assertFalse(os.path.exists(TRACES_PATH + Collector.get_stats_file(experiment)))
+
+    def test_sharded_experiment(self):
+        """ Sharded generation gives the same experiment """
+        kwargs = dict(linear_sampling=True, extend_up_to=30, groundtruth=True, seed=13)
+        reference = Collector.generate_experiment(experiment="test_sharded_reference", **kwargs)
+        experiment = "test_sharded_experiment"
+        try:
+            for shard_index in [2, 0, 1]:
+                Collector.generate_experiment(experiment=experiment, shard_index=shard_index, shard_count=3, **kwargs)
+                Stats.compute_experiment_stats(experiment, processes=1, shard_index=shard_index, shard_count=3)
+                if shard_index != 1:
+                    self.assertRaises(AssertionError, Collector.merge_shards, experiment, 3)
+            manifest = Collector.merge_shards(experiment, 3)
+            self.assertEqual(manifest, Collector.read_manifest(reference))
+            self.assertEqual(Collector.read_completed(experiment), Collector.read_completed(reference))
+            for folder in ["Trajectory", "Groundtruth"]:
+                for trace in manifest['traces']:
+                    with open(TRACES_PATH + f"{reference}/{folder}/{trace['name']}.plt") as expected, \
+                            open(TRACES_PATH + f"{experiment}/{folder}/{trace['name']}.plt") as generated:
+                        self.assertEqual(generated.read(), expected.read())
+            self.assertEqual(Stats.merge_shards(experiment, 3), Stats.compute_experiment_stats(reference, processes=1))
+        finally:
+            Collector.clean_experiment(reference)
+            Collector.clean_experiment(experiment)
+
+        # Shards of different experiments are rejected
+        experiment = "test_sharded_mismatch"
+        try:
+            Collector.generate_experiment(linear_sampling=True, seed=1, experiment=experiment,
+                                          shard_index=0, shard_count=2)
+            Collector.generate_experiment(linear_sampling=True, seed=1, experiment=experiment, alpha_noise=3,
+                                          max_speed=5, shard_index=1, shard_count=2)
+            with self.assertRaisesRegex(AssertionError, "different params"):
+                Collector.merge_shards(experiment, 2)
+        finally:
+            Collector.clean_experiment(experiment)
+
+    def test_output_periods(self):
+        """ One simulation written at several sampling rates """
+        experiment = Collector.generate_experiment(linear_sampling=True, groundtruth=True, seed=17, period=0.5,
+                                                   output_periods=[1, 2, 1.5], experiment="test_output_periods")
+        trajectories_2s = TRACES_PATH + f"{experiment}/{Collector.get_output_folder('Trajectory', 2)}/"
+        try:
+            for trace in Collector.read_manifest(experiment)['traces']:
+                pos, times = Stats.read_positions(TRACES_PATH + f"{experiment}/Trajectory/{trace['name']}.plt")
+                for output_period in [1, 2, 1.5]:
+                    folder = Collector.get_output_folder("Trajectory", output_period)
+                    output_pos, output_times = Stats.read_positions(
+                        TRACES_PATH + f"{experiment}/{folder}/{trace['name']}.plt"
+                    )
+                    self.assertEqual(output_times[0], times[0])
+                    self.assertTrue((diff(output_times) == output_period).all())
+                    if output_period != 1.5:
+                        # decimated
+                        assert_array_equal(output_pos, pos[::int(output_period / 0.5)])
+                    else:
+                        # interpolated, every other point is a simulated one
+                        assert_array_equal(output_pos[::2], pos[::6])
+            stats = Stats.compute_experiment_stats(experiment, processes=1)
+            self.assertEqual(stats['global']['over_max_speed'], [])
+            # The merge checks the traces of every period
+            self.assertEqual(len(Collector.merge_shards(experiment, 1)['traces']), len(os.listdir(trajectories_2s)))
+            for trace_file in os.listdir(trajectories_2s):
+                os.remove(trajectories_2s + trace_file)
+            self.assertRaises(AssertionError, Collector.merge_shards, experiment, 1)
+        finally:
+            Collector.clean_experiment(experiment)
+        self.assertEqual(list(Helper.resample([[0, 0], [1, 2], [2, 4]], 2, 1)[:, 1]), [0, 1, 2, 3, 4])
+        for output_period in (2, 1.5):
+            self.assertEqual(Helper.resample([], 1, output_period).shape, (0, 2))
+
+    def test_shared_venue(self):
+        """ Venue shared between processes """
+        places, _, paths4, paths4_full = collect_local_data()
+        venue = SharedVenue.publish(data=(places, paths4, paths4_full))
+        try:
+            # Attach from other processes
+            with Pool(2) as pool:
+                lengths = pool.map(_shared_route_length, [(venue.name, i) for i in range(len(paths4))])
+            self.assertEqual(lengths, [len(path['route'][0]['path']) for path in paths4])
+
+            attached = SharedVenue.attach(venue.name)
+            self.assertFalse(attached.coords.flags.writeable)
+            for i, path in enumerate(paths4):
+                coords, source, destination = attached.path(i)
+                assert_array_equal(coords, path['route'][0]['path'])
+                self.assertEqual((source, destination), (path['from']['placeId'], path['to']['placeId']))
+            self.assertEqual(attached.full_sources(), list(paths4_full.keys()))
+            for source, destinations in paths4_full.items():
+                self.assertEqual(attached.full_destinations(source), list(destinations.keys()))
+                for destination, path in destinations.items():
+                    assert_array_equal(attached.full_path(source, destination), path['route'][0]['path'])
+            for place in places:
+                metadata = attached.place(place['_id'])
+                self.assertEqual(metadata['floor'], place['floor'])
+                self.assertEqual(list(metadata['marker']), [place['marker']['latitude'], place['marker']['longitude']])
+                geometry = place['geometry']
+                # (lat, lon) of the point or of the polygon outer ring
+                expected = [geometry['coordinates']] if geometry['type'] == 'Point' else geometry['coordinates'][0]
+                self.assertEqual(metadata['geometry'][:, ::-1].tolist(), expected)
+            # Place ids are not truncated
+            self.assertEqual(attached.place_ids.dtype.itemsize, max(len(place_id) for place_id in attached.place_ids))
+
+            # Same traces from the shared venue as from the json files
+            for extend_up_to in (-1, 50):
+                experiment = Collector.generate_experiment(linear_sampling=True, extend_up_to=extend_up_to, seed=7,
+                                                           experiment="test_shared_venue", venue=attached)
+                try:
+                    manifest = Collector.read_manifest(experiment)
+                    local_venue = LocalVenue(paths4, paths4_full)
+                    self.assertEqual(manifest['traces'], Collector.select_traces(manifest['params'], local_venue, 7))
+                    for trace_index in range(len(manifest['traces'])):
+                        pos, _ = Collector.regenerate_trace(experiment, trace_index, (paths4, paths4_full))
+                        assert_array_equal(Collector.regenerate_trace(experiment, trace_index, attached)[0], pos)
+                finally:
+                    Collector.clean_experiment(experiment)
+            days = []
+            for day_venue in (attached, (paths4, paths4_full)):
+                experiment, _ = Scheduler.generate_day(duration=300, arrival_rate=0.02, mean_dwell=30, seed=7,
+                                                       experiment="test_shared_venue_day", venue=day_venue)
+                try:
+                    trajectories_path = TRACES_PATH + f"{experiment}/Trajectory/"
+                    days.append({
+                        trace_file: Collector.read_file(trajectories_path + trace_file)['lat'].tolist()
+                        for trace_file in os.listdir(trajectories_path)
+                    })
+                finally:
+                    Collector.clean_experiment(experiment)
+            self.assertTrue(days[0])
+            self.assertEqual(days[0], days[1])
+            attached.close()
+        finally:
+            venue.close()
+            venue.unlink()
+
+        # Attaching does not touch the publisher resource tracker registration, even from forked workers
+        script = "\n".join([
+            "from multiprocessing import Pool",
+            "from p3a_mapwize_pathgenerator.venue import SharedVenue",
+            "def attach(name):",
+            "    SharedVenue.attach(name).close()",
+            "if __name__ == '__main__':",
+            "    venue = SharedVenue.publish()",
+            "    with Pool(2) as pool:",
+            "        pool.map(attach, [venue.name] * 4)",
+            "    SharedVenue.attach(venue.name).close()",
+            "    venue.close()",
+            "    venue.unlink()",
+        ])
+        tracker_errors = subprocess.run(
+            [sys.executable, "-c", script], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True,
+            check=True
+        ).stderr
+        self.assertEqual(tracker_errors, "")
+
+
+def _shared_route_length(args):
+    name, path_index = args
+    venue = SharedVenue.attach(name)
+    length = len(venue.path(path_index)[0])
+    venue.close()
+    return length